@@ -6,7 +6,11 @@ with Opik observability tracking.
 """
 
 import asyncio
+import logging
 import os
+import random
+import time
+import weakref
 from typing import Any, Callable, Dict, Optional, TypeVar
 
 from opik import opik_context
@@ -23,6 +27,83 @@ from opik.evaluation.metrics import (
     score_result,
 )
 
+logger = logging.getLogger(__name__)
+
+# LLM-as-a-judge metrics by type: metric class, default judge model and the
+# arguments its `ascore` takes. `Contains` is handled separately (no model).
+_METRIC_SPECS = {
+    "Hallucination": (Hallucination, "gpt-4o", ("input", "output", "context")),
+    "AnswerRelevance": (AnswerRelevance, "gpt-4o", ("input", "output", "context")),
+    "Moderation": (Moderation, "openrouter/openai/gpt-4o", ("output",)),
+    "Usefulness": (Usefulness, "openrouter/openai/gpt-4o", ("input", "output")),
+    "ContextRecall": (ContextRecall, "openrouter/openai/gpt-4o", ("output", "context")),
+    "ContextPrecision": (ContextPrecision, "openrouter/openai/gpt-4o", ("output", "context")),
+}
+
+# Judge metrics are scored concurrently, both within a call and across questions
+# evaluated at the same time; this caps the judge LLM calls in flight at once
+METRICS_MAX_CONCURRENCY = int(os.environ.get("METRICS_MAX_CONCURRENCY", 8))
+# One semaphore per event loop, since a semaphore can't be shared between loops
+_metrics_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_metrics_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _metrics_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _metrics_semaphores[loop] = asyncio.Semaphore(METRICS_MAX_CONCURRENCY)
+    return semaphore
+
+
+class AsyncRateLimiter:
+    """
+    Token bucket allowing at most `max_rate` acquisitions per `time_period` seconds.
+    
+    Waiters are served in arrival order, so concurrent callers slow down smoothly
+    at the rate limit instead of bursting into HTTP 429 errors.
+    """
+    
+    def __init__(self, max_rate: float, time_period: float = 60.0):
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._tokens = float(max_rate)
+        self._last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self) -> None:
+        """Wait until a request may be sent, then use up one token."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                refill = (now - self._last_refill) * self.max_rate / self.time_period
+                self._tokens = min(self.max_rate, self._tokens + refill)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.time_period / self.max_rate)
+
+
+# Requests per minute allowed to the LLM provider (OpenRouter) for BAML calls
+OPENROUTER_QPM = int(os.environ.get("OPENROUTER_QPM", 500))
+_rate_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncRateLimiter]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_rate_limiter() -> AsyncRateLimiter:
+    loop = asyncio.get_running_loop()
+    limiter = _rate_limiters.get(loop)
+    if limiter is None:
+        limiter = _rate_limiters[loop] = AsyncRateLimiter(OPENROUTER_QPM)
+    return limiter
+
+
+async def acquire_rate_limit() -> None:
+    """Wait for the provider's rate limit before a BAML call; shared by all callers in the loop."""
+    await _get_rate_limiter().acquire()
 
 
 class BAMLInstrumentation:
@@ -73,11 +154,12 @@ class BAMLInstrumentation:
         baml_options["collector"].append(self.collector)
         kwargs["baml_options"] = baml_options
         
-        # Call the BAML function
+        # Call the BAML function, waiting for the provider's rate limit if needed
+        await acquire_rate_limit()
         result = await baml_function(*args, **kwargs)
         
         # Update Opik context with BAML data
-        self._update_opik_context(span_name, additional_metadata or {})
+        self._update_opik_context(span_name, additional_metadata)
         
         return result
     
@@ -106,64 +188,37 @@ class BAMLInstrumentation:
             sample_rate: Override the instance sample rate (optional)
             additional_metadata: Additional metadata to include in the span
         """
+        # Nothing to score: skip the sample rate lookup and all metric setup
+        if input is None or output is None or not metrics:
+            return
+        
         # Use passed sample_rate, or read from env var, or use instance sample_rate
         if sample_rate is not None:
             effective_sample_rate = sample_rate
         else:
             # Read directly from env var, fall back to instance sample_rate
-            import os as os_module
-            env_sample_rate = os_module.environ.get("METRICS_SAMPLE_RATE")
+            env_sample_rate = os.environ.get("METRICS_SAMPLE_RATE")
             effective_sample_rate = float(env_sample_rate) if env_sample_rate else self.sample_rate
         
-        # Check if we should run metrics based on sample rate
-        should_run_metrics = (input is not None and output is not None and 
-                            metrics is not None and effective_sample_rate > 0)
+        # Sample calls: only this fraction pays for the LLM-as-a-judge evaluations
+        should_run_metrics = random.random() < effective_sample_rate
         
         if should_run_metrics:
-            print(f"[DEBUG] Running metrics for span: {span_name} (sample_rate: {effective_sample_rate})")
+            logger.debug("Running metrics for span: %s (sample_rate: %s)", span_name, effective_sample_rate)
             metric_results = []
-            for metric_cfg in metrics:
+            # Feedback scores for Opik are built alongside the metric results
+            feedback_scores = []
+            score_args = {"input": input, "output": output, "context": context}
+            # Judge metrics are independent LLM calls, so they are scored concurrently
+            known_metrics = [
+                metric_cfg for metric_cfg in metrics
+                if metric_cfg["type"] == "Contains" or metric_cfg["type"] in _METRIC_SPECS
+            ]
+            score_results = await asyncio.gather(
+                *(self._score_metric(metric_cfg, score_args) for metric_cfg in known_metrics)
+            )
+            for metric_cfg, score_result in zip(known_metrics, score_results):
                 metric_type = metric_cfg["type"]
-                params = metric_cfg.get("params", {})
-                if metric_type == "Hallucination":
-                    # Extract model parameter from params or use default
-                    model = params.get("model", "gpt-4o")
-                    metric = Hallucination(track = True, model=model, **{k: v for k, v in params.items() if k != "model"})
-                    score_result = await metric.ascore(input=input, output=output, context=context)
-                elif metric_type == "AnswerRelevance":
-                    # Extract model parameter from params or use default
-                    model = params.get("model", "gpt-4o")
-                    metric = AnswerRelevance(track = True, model=model, **{k: v for k, v in params.items() if k != "model"})
-                    score_result = await metric.ascore(input=input, output=output, context=context)
-                elif metric_type == "Contains":
-                    # Filter out 'output' and 'reference' from params as they're not constructor parameters
-                    constructor_params = {k: v for k, v in params.items() if k not in ["output", "reference"]}
-                    metric = Contains(track = True, **constructor_params)
-                    reference = params.get("reference", "")
-                    score_result = await metric.ascore(output=output, reference=reference)
-                elif metric_type == "Moderation":
-                    # Extract model parameter from params or use default
-                    model = params.get("model", "openrouter/openai/gpt-4o")
-                    metric = Moderation(track = True, model=model, **{k: v for k, v in params.items() if k != "model"})
-                    score_result = await metric.ascore(output=output)
-                elif metric_type == "Usefulness":
-                    # Extract model parameter from params or use default
-                    model = params.get("model", "openrouter/openai/gpt-4o")
-                    metric = Usefulness(track = True, model=model, **{k: v for k, v in params.items() if k != "model"})
-                    score_result = await metric.ascore(input=input, output=output)
-                elif metric_type == "ContextRecall":
-                    # Extract model parameter from params or use default
-                    model = params.get("model", "openrouter/openai/gpt-4o")
-                    metric = ContextRecall(track = True, model=model, **{k: v for k, v in params.items() if k != "model"})
-                    score_result = await metric.ascore(output=output, context=context)
-                elif metric_type == "ContextPrecision":
-                    # Extract model parameter from params or use default    
-                    model = params.get("model", "openrouter/openai/gpt-4o")
-                    metric = ContextPrecision(track = True, model=model, **{k: v for k, v in params.items() if k != "model"})
-                    score_result = await metric.ascore(output=output, context=context)
-
-                else:
-                    continue  # Unknown metric type
                 # Handle both sync and async score results
                 if hasattr(score_result, 'value'):
                     value = score_result.value
@@ -186,12 +241,12 @@ class BAMLInstrumentation:
                 
                 # Ensure value is a valid number, skip if None or invalid
                 if value is None or not isinstance(value, (int, float)):
-                    print(f"[WARNING] Skipping metric {metric_type} with invalid value: {value}")
+                    logger.warning("Skipping metric %s with invalid value: %s", metric_type, value)
                     continue
                 
                 # Ensure value is within valid range (0-1 for most metrics)
                 if value < 0 or value > 1:
-                    print(f"[WARNING] Metric {metric_type} value {value} out of range [0,1], clamping")
+                    logger.warning("Metric %s value %s out of range [0,1], clamping", metric_type, value)
                     value = max(0.0, min(1.0, value))
                 
                 metric_results.append({
@@ -199,24 +254,31 @@ class BAMLInstrumentation:
                     "value": value,
                     "reason": reason,
                 })
+                feedback_scores.append({
+                    "name": metric_type,
+                    "value": value,
+                    "reason": reason if reason else None
+                })
             
-            print("[DEBUG] Metric results:")
-            for result in metric_results:
-                print(f"  - {result['name']}: {result['value']} ({result['reason']})\n")
-            
-            # Convert metric results to feedback scores format for Opik
-            feedback_scores = []
-            for result in metric_results:
-                feedback_score = {
-                    "name": result["name"],
-                    "value": result["value"],
-                    "reason": result["reason"] if result["reason"] else None
-                }
-                feedback_scores.append(feedback_score)
+            # Only format the per-metric summary when debug logging is on
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Metric results:\n%s",
+                    "\n".join(f"  - {r['name']}: {r['value']} ({r['reason']})" for r in metric_results)
+                )
             
             # Update the existing span with metric results and feedback scores
-            current_metadata = additional_metadata or {}
-            current_metadata["metrics"] = metric_results
+            # Copy the caller's metadata rather than adding "metrics" to it in place.
+            # The sample rate is recorded so totals can be recovered from the sampled spans
+            sampling_metadata = {
+                "metrics": metric_results,
+                "metrics_sampled": True,
+                "metrics_sample_rate": effective_sample_rate,
+            }
+            if additional_metadata is None:
+                current_metadata = sampling_metadata
+            else:
+                current_metadata = {**additional_metadata, **sampling_metadata}
             opik_context.update_current_span(
                 name=span_name,
                 metadata=current_metadata,
@@ -228,13 +290,41 @@ class BAMLInstrumentation:
                 feedback_scores=feedback_scores
             )
     
-    def _update_opik_context(self, span_name: str, additional_metadata: Dict[str, Any]) -> None:
+    async def _score_metric(self, metric_cfg: Dict[str, Any], score_args: Dict[str, Any]) -> Any:
+        """
+        Build the metric described by `metric_cfg` and score it.
+        
+        Args:
+            metric_cfg: Metric config, e.g. {"type": "Hallucination", "params": {}}
+            score_args: The input, output and context available to the metric
+            
+        Returns:
+            The raw score result returned by the metric
+        """
+        metric_type = metric_cfg["type"]
+        params = metric_cfg.get("params", {})
+        if metric_type == "Contains":
+            # Filter out 'output' and 'reference' from params as they're not constructor parameters
+            constructor_params = {k: v for k, v in params.items() if k not in ["output", "reference"]}
+            metric = Contains(track = True, **constructor_params)
+            reference = params.get("reference", "")
+            return await metric.ascore(output=score_args["output"], reference=reference)
+        
+        metric_class, default_model, score_arg_names = _METRIC_SPECS[metric_type]
+        # Extract model parameter from params or use default
+        model = params.get("model", default_model)
+        metric = metric_class(track = True, model=model, **{k: v for k, v in params.items() if k != "model"})
+        # Only the judge LLM calls take a concurrency slot; Contains is scored locally
+        async with _get_metrics_semaphore():
+            return await metric.ascore(**{name: score_args[name] for name in score_arg_names})
+    
+    def _update_opik_context(self, span_name: str, additional_metadata: Optional[Dict[str, Any]]) -> None:
         """
         Update the Opik context with BAML collector data.
         
         Args:
             span_name: Name for the Opik span
-            additional_metadata: Additional metadata to include
+            additional_metadata: Additional metadata to include (optional)
         """
         if self.collector.last is not None:
             log = self.collector.last
@@ -244,8 +334,10 @@ class BAMLInstrumentation:
                 metadata = {
                     "function_name": log.function_name,
                     "duration_ms": call.timing.duration_ms if call.timing else None,
-                    **additional_metadata
                 }
+                # Most calls pass no extra metadata; only merge when there is some
+                if additional_metadata:
+                    metadata.update(additional_metadata)
                 
                 usage = {
                     "prompt_tokens": call.usage.input_tokens,
@@ -327,6 +419,10 @@ async def run_post_call_metrics(
         sample_rate: Fraction of calls to sample for metrics (if None, reads from METRICS_SAMPLE_RATE env var)
         additional_metadata: Additional metadata to include in the span
     """
+    # Avoid creating a collector when there is nothing to score
+    if input is None or output is None or not metrics:
+        return
+    
     instrumentation = BAMLInstrumentation(collector_name, sample_rate=sample_rate)
     await instrumentation.run_post_call_metrics(
         span_name,
@@ -6,13 +6,20 @@ with Opik traces and spans for better observability and debugging.
 """
 
 import asyncio
+import functools
+import inspect
 import os
-from typing import Any, Dict, List, Optional
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
 from dataclasses import dataclass
 from datetime import datetime
 
 from opik import opik_context
 from guardrails import (
+    ACTION_VALUES,
+    OPIK_TRACING_ENABLED,
+    SEVERITY_VALUES,
     EmailGuardrail,
     GuardrailAction,
     GuardrailSeverity,
@@ -21,7 +28,7 @@ from guardrails import (
 )
 
 
-@dataclass
+@dataclass(slots=True)
 class GuardrailSpanInfo:
     """Information for creating guardrail-specific spans."""
     span_name: str
@@ -31,6 +38,7 @@ class GuardrailSpanInfo:
     results: List[GuardrailResult]
     processing_time_ms: float
     timestamp: datetime
+    input_length: int = 0
 
 
 class EnhancedGuardrailManager:
@@ -41,10 +49,21 @@ class EnhancedGuardrailManager:
     and spans, including custom metrics, tags, and detailed logging.
     """
     
-    def __init__(self, guardrails: List[Any] = None):
-        """Initialize the enhanced guardrail manager."""
+    def __init__(self, guardrails: List[Any] = None, history_size: int = 100):
+        """
+        Initialize the enhanced guardrail manager.
+        
+        Args:
+            guardrails: List of guardrail instances
+            history_size: Number of recent validations to keep in `span_history`
+        """
         self.guardrails = guardrails or []
-        self.span_history: List[GuardrailSpanInfo] = []
+        # Only recent spans are kept; lifetime metrics use running counters
+        self.span_history: Deque[GuardrailSpanInfo] = deque(maxlen=history_size)
+        self._total_validations = 0
+        self._total_results = 0
+        self._total_triggered = 0
+        self._total_processing_time_ms = 0.0
     
     def add_guardrail(self, guardrail: Any) -> None:
         """Add a guardrail to the manager."""
@@ -61,6 +80,40 @@ class EnhancedGuardrailManager:
         """
         Validate text with detailed Opik tracing and metrics.
         
+        Async wrapper around `validate_with_detailed_tracing_sync`.
+        
+        Args:
+            text: Text to validate
+            span_name: Name for the Opik span
+            trace_tags: Additional tags for the trace
+            custom_metadata: Additional metadata to include
+            validation_type: Type of validation ("input" or "output")
+            
+        Returns:
+            Processed text
+            
+        Raises:
+            GuardrailValidationFailed: If any guardrail blocks the text
+        """
+        return self.validate_with_detailed_tracing_sync(
+            text,
+            span_name=span_name,
+            trace_tags=trace_tags,
+            custom_metadata=custom_metadata,
+            validation_type=validation_type
+        )
+    
+    def validate_with_detailed_tracing_sync(
+        self,
+        text: str,
+        span_name: str = "guardrail_validation",
+        trace_tags: List[str] = None,
+        custom_metadata: Dict[str, Any] = None,
+        validation_type: str = "general"  # "input" or "output"
+    ) -> str:
+        """
+        Validate text with detailed Opik tracing and metrics, without an event loop.
+        
         Args:
             text: Text to validate
             span_name: Name for the Opik span
@@ -74,7 +127,9 @@ class EnhancedGuardrailManager:
         Raises:
             GuardrailValidationFailed: If any guardrail blocks the text
         """
+        # Wall-clock time is only used as the span timestamp; durations use a monotonic clock
         start_time = datetime.now()
+        start_ns = time.perf_counter_ns()
         
         # Run all guardrails
         results = []
@@ -82,8 +137,7 @@ class EnhancedGuardrailManager:
             result = guardrail.validate(text)
             results.append(result)
         
-        end_time = datetime.now()
-        processing_time = (end_time - start_time).total_seconds() * 1000
+        processing_time = (time.perf_counter_ns() - start_ns) / 1e6
         
         # Create detailed span information
         span_info = GuardrailSpanInfo(
@@ -93,7 +147,8 @@ class EnhancedGuardrailManager:
             output_text=text,  # Will be updated if masking occurs
             results=results,
             processing_time_ms=processing_time,
-            timestamp=start_time
+            timestamp=start_time,
+            input_length=len(text)
         )
         
         # Process results and handle actions
@@ -105,11 +160,15 @@ class EnhancedGuardrailManager:
         masking_details = []
         
         # Apply masking if needed
-        for guardrail in self.guardrails:
+        for guardrail, result in zip(self.guardrails, results):
             if isinstance(guardrail, EmailGuardrail) and guardrail.mask_emails:
                 original_text = processed_text
-                processed_text = guardrail.mask_text(processed_text)
-                if processed_text != original_text:
+                # Spans found by validate() only apply while the text is unmodified
+                spans = result.details.get("spans") if processed_text is text else None
+                processed_text = guardrail.mask_text(processed_text, spans=spans)
+                # mask_text returns its input object when there is nothing to mask, and a
+                # masked text keeps its length, so identity avoids an O(n) comparison
+                if processed_text is not original_text:
                     masking_applied = True
                     masking_details.append({
                         "guardrail_type": "email",
@@ -131,7 +190,7 @@ class EnhancedGuardrailManager:
         })
         
         # Create comprehensive Opik span
-        await self._create_detailed_span(span_info, trace_tags, enhanced_metadata)
+        self._create_detailed_span(span_info, trace_tags, enhanced_metadata)
         
         # Handle blocking actions
         for result in triggered_results:
@@ -141,12 +200,16 @@ class EnhancedGuardrailManager:
                     result
                 )
         
-        # Store span info for later analysis
+        # Store span info for later analysis and update the running metrics
         self.span_history.append(span_info)
+        self._total_validations += 1
+        self._total_results += len(results)
+        self._total_triggered += len(triggered_results)
+        self._total_processing_time_ms += processing_time
         
         return processed_text
     
-    async def _create_detailed_span(
+    def _create_detailed_span(
         self,
         span_info: GuardrailSpanInfo,
         trace_tags: List[str] = None,
@@ -154,15 +217,20 @@ class EnhancedGuardrailManager:
     ) -> None:
         """Create a detailed Opik span with comprehensive guardrail information."""
         
+        # Nothing to record when Opik tracing is disabled
+        if not OPIK_TRACING_ENABLED:
+            return
+        
         # Prepare metadata
         metadata = {
             "guardrail_type": span_info.guardrail_type,
             "processing_time_ms": span_info.processing_time_ms,
-            "input_length": len(span_info.input_text),
+            "input_length": span_info.input_length,
             "output_length": len(span_info.output_text),
             "guardrails_run": len(span_info.results),
             "guardrails_triggered": len([r for r in span_info.results if r.triggered]),
-            "text_modified": span_info.input_text != span_info.output_text,
+            # Masking is the only modification, so avoid an O(n) comparison of the texts
+            "text_modified": custom_metadata.get("text_modified_by_masking", False) if custom_metadata else False,
             "timestamp": span_info.timestamp.isoformat(),
             "validation_phase": custom_metadata.get("validation_type", "general") if custom_metadata else "general",
         }
@@ -173,24 +241,36 @@ class EnhancedGuardrailManager:
         
         # Prepare detailed results
         detailed_results = []
-        all_entities = []
+        all_entities = set()
         severity_counts = {"low": 0, "medium": 0, "high": 0, "critical": 0}
         action_counts = {"block": 0, "warn": 0, "log": 0}
+        has_critical = has_high = has_block = has_warn = False
         
         for result in span_info.results:
+            severity = result.severity
+            action = result.action
+            severity_value = SEVERITY_VALUES[severity]
+            action_value = ACTION_VALUES[action]
+            
             # Count severities and actions
-            severity_counts[result.severity.value] += 1
+            severity_counts[severity_value] += 1
             if result.triggered:
-                action_counts[result.action.value] += 1
+                action_counts[action_value] += 1
+            
+            # Track tag flags in the same pass
+            has_critical = has_critical or severity == GuardrailSeverity.CRITICAL
+            has_high = has_high or severity == GuardrailSeverity.HIGH
+            has_block = has_block or action == GuardrailAction.BLOCK
+            has_warn = has_warn or action == GuardrailAction.WARN
             
             # Collect entities
             if result.entities_found:
-                all_entities.extend(result.entities_found)
+                all_entities.update(result.entities_found)
             
             # Create detailed result entry
             detailed_result = {
-                "action": result.action.value,
-                "severity": result.severity.value,
+                "action": action_value,
+                "severity": severity_value,
                 "triggered": result.triggered,
                 "message": result.message,
                 "entities_found": result.entities_found,
@@ -200,7 +280,7 @@ class EnhancedGuardrailManager:
         
         # Add aggregated information
         metadata.update({
-            "entities_found": list(set(all_entities)),
+            "entities_found": list(all_entities),
             "severity_distribution": severity_counts,
             "action_distribution": action_counts,
             "results": detailed_results
@@ -212,15 +292,15 @@ class EnhancedGuardrailManager:
             tags.extend(trace_tags)
         
         # Add severity-based tags
-        if any(r.severity == GuardrailSeverity.CRITICAL for r in span_info.results):
+        if has_critical:
             tags.append("critical")
-        if any(r.severity == GuardrailSeverity.HIGH for r in span_info.results):
+        if has_high:
             tags.append("high_severity")
         
         # Add action-based tags
-        if any(r.action == GuardrailAction.BLOCK for r in span_info.results):
+        if has_block:
             tags.append("blocked")
-        if any(r.action == GuardrailAction.WARN for r in span_info.results):
+        if has_warn:
             tags.append("warned")
         
         # Create the span
@@ -284,20 +364,15 @@ class EnhancedGuardrailManager:
     
     def get_guardrail_metrics(self) -> Dict[str, Any]:
         """Get aggregated metrics from guardrail history."""
-        if not self.span_history:
+        if not self._total_validations:
             return {}
         
-        total_validations = len(self.span_history)
-        total_entities = sum(len(info.results) for info in self.span_history)
-        total_triggered = sum(
-            sum(1 for r in info.results if r.triggered) 
-            for info in self.span_history
-        )
+        total_validations = self._total_validations
+        total_entities = self._total_results
+        total_triggered = self._total_triggered
         
         # Calculate average processing time
-        avg_processing_time = sum(
-            info.processing_time_ms for info in self.span_history
-        ) / total_validations
+        avg_processing_time = self._total_processing_time_ms / total_validations
         
         return {
             "total_validations": total_validations,
@@ -329,35 +404,39 @@ class GuardrailTraceDecorator:
         self.span_name_prefix = span_name_prefix
         self.manager = EnhancedGuardrailManager(guardrails)
     
+    def _process_args(self, func, args: tuple) -> tuple:
+        """Validate the text argument (assumed to be the first one) and return the updated args."""
+        if not (args and isinstance(args[0], str)):
+            # No text argument found, call function normally
+            return args
+        
+        processed_text = self.manager.validate_with_detailed_tracing_sync(
+            args[0],
+            span_name=f"{self.span_name_prefix}_{func.__name__}",
+            trace_tags=[func.__name__, "decorated"],
+            custom_metadata={
+                "function_name": func.__name__,
+                "decorator_type": "guardrail_trace"
+            }
+        )
+        
+        # Call function with processed text
+        return (processed_text,) + args[1:]
+    
     def __call__(self, func):
-        """Decorator implementation."""
-        async def wrapper(*args, **kwargs):
-            # Extract text from function arguments (assumes first arg is text)
-            if args and isinstance(args[0], str):
-                text = args[0]
-                span_name = f"{self.span_name_prefix}_{func.__name__}"
-                
-                # Validate with guardrails
-                processed_text = await self.manager.validate_with_detailed_tracing(
-                    text,
-                    span_name=span_name,
-                    trace_tags=[func.__name__, "decorated"],
-                    custom_metadata={
-                        "function_name": func.__name__,
-                        "decorator_type": "guardrail_trace"
-                    }
-                )
-                
-                # Call function with processed text
-                if args:
-                    args = (processed_text,) + args[1:]
-                
-                return await func(*args, **kwargs)
-            else:
-                # No text argument found, call function normally
-                return await func(*args, **kwargs)
+        """Decorator implementation, supporting both sync and async functions."""
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await func(*self._process_args(func, args), **kwargs)
+            
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            return func(*self._process_args(func, args), **kwargs)
         
-        return wrapper
+        return sync_wrapper
 
 
 # Example usage functions
@@ -405,10 +484,8 @@ async def example_function_with_guardrails():
 @GuardrailTraceDecorator([
     EmailGuardrail(action=GuardrailAction.WARN, mask_emails=True)
 ], "decorated_function")
-async def process_user_input(text: str) -> str:
+def process_user_input(text: str) -> str:
     """Example function decorated with guardrail tracing."""
-    # Simulate processing
-    await asyncio.sleep(0.1)
     return f"Processed: {text}"
 
 
@@ -423,7 +500,7 @@ async def main():
     
     # Example 2: Decorator usage
     print("\n2. Decorator Usage:")
-    result = await process_user_input("Contact me at user@example.com")
+    result = process_user_input("Contact me at user@example.com")
     print(f"Result: {result}")
     
     print("\nEnhanced integration completed!")
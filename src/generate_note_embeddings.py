@@ -13,6 +13,15 @@ from lancedb.pydantic import LanceModel, Vector
 registry = get_registry()
 model = registry.get("ollama").create(name="nomic-embed-text")
 
+# IVF_PQ settings for the note vectors: 96 sub-vectors of 8 dimensions each with
+# 8-bit codes, i.e. one byte per 8 floats instead of 32 bytes. The PQ codebooks
+# need at least 256 training rows, so smaller tables keep the flat (exact) search.
+# The partition count is fixed rather than left to LanceDB's row-count-based default,
+# so the share of partitions searched (VECTOR_SEARCH_NPROBES in rag.py) stays the same
+VECTOR_INDEX_MIN_ROWS = 256
+VECTOR_INDEX_PARTITIONS = 64
+VECTOR_INDEX_SUB_VECTORS = 96
+
 
 class Note(LanceModel):
     record_id: int
@@ -47,6 +56,16 @@ def main(db_path: str, limit: int = 10000) -> None:
 
     # Generate FTS index in LanceDB
     table.create_fts_index("note", replace=True)
+
+    # Quantized vector index, so hybrid search scans compact codes instead of FP32 vectors
+    if len(table) >= VECTOR_INDEX_MIN_ROWS:
+        table.create_index(
+            vector_column_name="vector",
+            index_type="IVF_PQ",
+            num_partitions=VECTOR_INDEX_PARTITIONS,
+            num_sub_vectors=VECTOR_INDEX_SUB_VECTORS,
+            num_bits=8,
+        )
     print(f"Finished creating FTS and vector indices for '{TABLE_NAME}' table")
 
 
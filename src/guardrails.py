@@ -8,23 +8,171 @@ The guardrails check inputs and outputs for various risks and can be integrated
 with the existing Opik instrumentation system.
 """
 
+import io
+import logging
 import re
 import os
+from bisect import bisect_right
 from typing import Any, Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
+from functools import lru_cache
 
 from opik import opik_context
 
+logger = logging.getLogger(__name__)
 
-class GuardrailAction(Enum):
+try:
+    import hyperscan
+except ImportError:  # Optional dependency: fall back to Python's `re` engine
+    hyperscan = None
+
+try:
+    import re2
+except ImportError:  # Optional dependency: fall back to Python's `re` engine
+    re2 = None
+
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:  # Optional dependency: mask emails in pure Python
+    njit = None
+
+
+# Opik tracing can be switched off with OPIK_TRACK_DISABLE; span metadata is skipped then
+OPIK_TRACING_ENABLED = os.environ.get("OPIK_TRACK_DISABLE", "false").lower() not in ("true", "1")
+
+# Email regex pattern: RFC 1035-style domain labels (alphanumeric at both ends,
+# at most 63 characters) and a 2-24 letter TLD keep the match space small
+EMAIL_PATTERN = (
+    r'\b[A-Za-z0-9._%+\-]+@'
+    r'[A-Za-z0-9](?:[A-Za-z0-9\-]{0,61}[A-Za-z0-9])?'
+    r'(?:\.[A-Za-z0-9](?:[A-Za-z0-9\-]{0,61}[A-Za-z0-9])?)*'
+    r'\.[A-Za-z]{2,24}\b'
+)
+
+# Joins texts for a single batched scan; the email pattern never matches it
+_TEXT_SEPARATOR = "\x00"
+
+
+@lru_cache(maxsize=None)
+def _get_hyperscan_email_db():
+    """
+    Compile the email pattern into a Hyperscan DFA database, if available.
+
+    Compiled on first use rather than at import, so importing this module
+    stays cheap for callers that never construct an `EmailGuardrail`.
+    """
+    if hyperscan is None:
+        return None
+    try:
+        db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+        db.compile(
+            expressions=[EMAIL_PATTERN.encode()],
+            ids=[0],
+            flags=[0],
+        )
+    except Exception:
+        # Pattern not supported by this Hyperscan build; use `re` instead
+        return None
+    return db
+
+
+def _compile_regex(pattern: str):
+    """Compile a pattern with the linear-time RE2 engine when installed, else with `re`."""
+    if re2 is not None:
+        try:
+            return re2.compile(pattern)
+        except Exception:
+            # Pattern uses features RE2 does not support (e.g. backreferences)
+            pass
+    return re.compile(pattern)
+
+
+@lru_cache(maxsize=None)
+def _get_email_regex(pattern: str = EMAIL_PATTERN) -> re.Pattern:
+    """Compile an email pattern once and share it across guardrail instances."""
+    return _compile_regex(pattern)
+
+
+# Compiled once at import; shared by every guardrail using the default pattern
+_EMAIL_RE = _get_email_regex(EMAIL_PATTERN)
+
+# Common email domains to potentially block
+_COMMON_DOMAINS = frozenset({
+    'gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com',
+    'aol.com', 'icloud.com', 'protonmail.com', 'mail.com'
+})
+
+
+def _hyperscan_has_email(text: str) -> bool:
+    """
+    Check whether ASCII text contains an email address using the Hyperscan database.
+
+    Only used as a prefilter: Hyperscan reports match ends (and at best the
+    leftmost start for each), which can't be reduced to the spans `re.finditer`
+    returns when emails are joined by local-part characters such as ".", so the
+    spans themselves always come from the compiled regex.
+    """
+    found = False
+
+    def on_match(_id, _start, _end, _flags, _context):
+        nonlocal found
+        found = True
+
+    _get_hyperscan_email_db().scan(text.encode("ascii"), match_event_handler=on_match)
+    return found
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _mask_kernel(buf, spans, mask_byte):
+        """
+        Mask email spans in place in an ASCII byte buffer.
+
+        Keeps the first and last username characters (masking usernames of two
+        characters or fewer entirely) and the first character of each domain part.
+        """
+        at_byte = 64  # "@"
+        dot_byte = 46  # "."
+        for i in range(spans.shape[0]):
+            start = spans[i, 0]
+            end = spans[i, 1]
+            at = start
+            while buf[at] != at_byte:
+                at += 1
+            if at - start <= 2:
+                for j in range(start, at):
+                    buf[j] = mask_byte
+            else:
+                for j in range(start + 1, at - 1):
+                    buf[j] = mask_byte
+            part_start = True
+            for j in range(at + 1, end):
+                if buf[j] == dot_byte:
+                    part_start = True
+                elif part_start:
+                    part_start = False
+                else:
+                    buf[j] = mask_byte
+
+
+    def _jit_mask_text(text: str, spans: List[Tuple[int, int, str]], mask_char: str) -> str:
+        """Mask email spans in ASCII text with the Numba kernel."""
+        buf = np.frombuffer(text.encode("ascii"), dtype=np.uint8).copy()
+        span_array = np.array([(start, end) for start, end, _ in spans], dtype=np.int64)
+        _mask_kernel(buf, span_array, np.uint8(ord(mask_char)))
+        return buf.tobytes().decode("ascii")
+
+
+class GuardrailAction(str, Enum):
     """Actions to take when a guardrail is triggered."""
     BLOCK = "block"
     WARN = "warn"
     LOG = "log"
 
 
-class GuardrailSeverity(Enum):
+class GuardrailSeverity(str, Enum):
     """Severity levels for guardrail violations."""
     LOW = "low"
     MEDIUM = "medium"
@@ -32,7 +180,12 @@ class GuardrailSeverity(Enum):
     CRITICAL = "critical"
 
 
-@dataclass
+# Enum `.value` goes through a descriptor, so cache the strings used in span metadata
+ACTION_VALUES = {action: action.value for action in GuardrailAction}
+SEVERITY_VALUES = {severity: severity.value for severity in GuardrailSeverity}
+
+
+@dataclass(slots=True, frozen=True)
 class GuardrailResult:
     """Result of a guardrail check."""
     triggered: bool
@@ -40,7 +193,37 @@ class GuardrailResult:
     severity: GuardrailSeverity
     message: str
     details: Dict[str, Any]
-    entities_found: List[str] = None
+    entities_found: List[str] = field(default_factory=list)
+
+
+class _DomainTrie:
+    """
+    Trie over reversed domain labels.
+    
+    A domain matches when it equals a stored domain or is one of its subdomains,
+    so storing "example.com" also matches "mail.example.com".
+    """
+    
+    _TERMINAL = None
+    
+    def __init__(self, domains):
+        self._root = {}
+        for domain in domains:
+            node = self._root
+            for label in reversed(domain.split('.')):
+                node = node.setdefault(label, {})
+            node[self._TERMINAL] = True
+    
+    def matches(self, domain: str) -> bool:
+        """Return whether the domain or one of its parent domains is in the trie."""
+        node = self._root
+        for label in reversed(domain.split('.')):
+            node = node.get(label)
+            if node is None:
+                return False
+            if self._TERMINAL in node:
+                return True
+        return False
 
 
 class GuardrailValidationFailed(Exception):
@@ -67,7 +250,8 @@ class EmailGuardrail:
         allowed_domains: List[str] = None,
         blocked_domains: List[str] = None,
         mask_emails: bool = False,
-        mask_char: str = "*"
+        mask_char: str = "*",
+        pattern: str = EMAIL_PATTERN
     ):
         """
         Initialize the email guardrail.
@@ -80,25 +264,50 @@ class EmailGuardrail:
             blocked_domains: List of blocked email domains (blacklist)
             mask_emails: Whether to mask detected emails in the output
             mask_char: Character to use for masking
+            pattern: Regex used to detect email addresses (every match must contain "@")
         """
         self.action = action
         self.severity = severity
         self.block_common_domains = block_common_domains
-        self.allowed_domains = allowed_domains or []
-        self.blocked_domains = blocked_domains or []
+        # Store domains as lowercase frozensets for O(1), case-insensitive lookups
+        self.allowed_domains = frozenset(d.lower() for d in (allowed_domains or ()))
+        self.blocked_domains = frozenset(d.lower() for d in (blocked_domains or ()))
+        self._has_allowlist = bool(self.allowed_domains)
+        # Tries let the lists cover subdomains (e.g. "mail.example.com" for "example.com")
+        self._allowed_trie = _DomainTrie(self.allowed_domains)
+        self._blocked_trie = _DomainTrie(self.blocked_domains)
         self.mask_emails = mask_emails
         self.mask_char = mask_char
+        # Precomputed mask runs; domain labels are at most 63 characters long
+        self._mask_cache = [mask_char * i for i in range(65)]
+        # The Numba kernel works on single bytes, so it needs a one-character ASCII mask
+        self._use_mask_kernel = njit is not None and len(mask_char) == 1 and mask_char.isascii()
         
-        # Email regex pattern (comprehensive)
-        self.email_pattern = re.compile(
-            r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+        self.pattern = pattern
+        self.email_pattern = _EMAIL_RE if pattern == EMAIL_PATTERN else _get_email_regex(pattern)
+        # The Hyperscan database is compiled for the default pattern only
+        self._use_hyperscan = (
+            pattern == EMAIL_PATTERN and _get_hyperscan_email_db() is not None
         )
         
-        # Common email domains to potentially block
-        self.common_domains = {
-            'gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com',
-            'aol.com', 'icloud.com', 'protonmail.com', 'mail.com'
-        }
+        self.common_domains = _COMMON_DOMAINS
+        # Blocking on any email only needs to know whether one exists
+        self._block_on_any = (
+            self.action == GuardrailAction.BLOCK
+            and not block_common_domains
+            and not self.allowed_domains
+            and not self.blocked_domains
+        )
+    
+    def _find_email_spans(self, text: str) -> List[Tuple[int, int, str]]:
+        """Find all (start, end, email) spans, using Hyperscan for ASCII text when installed."""
+        # Every email contains an "@"; a C-level substring check avoids the
+        # regex engine entirely for the common no-email case
+        if '@' not in text:
+            return []
+        if self._use_hyperscan and text.isascii() and not _hyperscan_has_email(text):
+            return []
+        return [(m.start(), m.end(), m.group(0)) for m in self.email_pattern.finditer(text)]
     
     def validate(self, text: str) -> GuardrailResult:
         """
@@ -120,8 +329,26 @@ class EmailGuardrail:
                 entities_found=[]
             )
         
-        # Find all email addresses
-        emails = self.email_pattern.findall(text)
+        # search() stops at the first match, so text with a stray "@" but no
+        # email never builds a match list
+        if (self._block_on_any and not self._use_hyperscan and '@' in text
+                and self.email_pattern.search(text) is None):
+            return self.finalize([])
+        
+        spans = self._find_email_spans(text)
+        return self.finalize(spans)
+    
+    def finalize(self, spans: List[Tuple[int, int, str]]) -> GuardrailResult:
+        """
+        Build the validation result from (start, end, email) spans found in the text.
+        
+        Args:
+            spans: Email spans, e.g. from a combined scan in `GuardrailManager`
+            
+        Returns:
+            GuardrailResult with validation details
+        """
+        emails = [email for _, _, email in spans]
         
         if not emails:
             return GuardrailResult(
@@ -129,7 +356,7 @@ class EmailGuardrail:
                 action=self.action,
                 severity=self.severity,
                 message="No email addresses detected",
-                details={"total_emails": 0},
+                details={"total_emails": 0, "spans": []},
                 entities_found=[]
             )
         
@@ -137,12 +364,23 @@ class EmailGuardrail:
         email_details = []
         blocked_emails = []
         allowed_emails = []
+        common_emails = []
+        # Domains often repeat within a text, so classify each one only once;
+        # the cache also hands back one shared string per distinct domain
+        domain_cache = {}
         
         for email in emails:
-            domain = email.split('@')[1].lower()
-            is_common = domain in self.common_domains
-            is_allowed = domain in self.allowed_domains if self.allowed_domains else True
-            is_blocked = domain in self.blocked_domains
+            domain = email.partition('@')[2].lower()
+            classification = domain_cache.get(domain)
+            if classification is None:
+                classification = (
+                    domain,
+                    domain in self.common_domains,
+                    not self._has_allowlist or self._allowed_trie.matches(domain),
+                    self._blocked_trie.matches(domain),
+                )
+                domain_cache[domain] = classification
+            domain, is_common, is_allowed, is_blocked = classification
             
             email_info = {
                 "email": email,
@@ -153,6 +391,8 @@ class EmailGuardrail:
             }
             email_details.append(email_info)
             
+            if is_common:
+                common_emails.append(email)
             if is_blocked:
                 blocked_emails.append(email)
             elif is_allowed:
@@ -166,11 +406,9 @@ class EmailGuardrail:
             should_trigger = True
             trigger_reasons.append(f"Blocked domains detected: {', '.join(blocked_emails)}")
         
-        if self.block_common_domains:
-            common_emails = [e for e in emails if e.split('@')[1].lower() in self.common_domains]
-            if common_emails:
-                should_trigger = True
-                trigger_reasons.append(f"Common domains detected: {', '.join(common_emails)}")
+        if self.block_common_domains and common_emails:
+            should_trigger = True
+            trigger_reasons.append(f"Common domains detected: {', '.join(common_emails)}")
         
         # If no specific blocking rules, trigger on any email if action is BLOCK
         if not should_trigger and self.action == GuardrailAction.BLOCK and emails:
@@ -190,51 +428,87 @@ class EmailGuardrail:
                 "email_details": email_details,
                 "block_common_domains": self.block_common_domains,
                 "has_blocked_domains": bool(self.blocked_domains),
-                "has_allowed_domains": bool(self.allowed_domains)
+                "has_allowed_domains": bool(self.allowed_domains),
+                "spans": spans
             },
             entities_found=emails
         )
         
         return result
     
-    def mask_text(self, text: str) -> str:
+    def validate_and_mask(self, text: str) -> Tuple[GuardrailResult, str]:
+        """
+        Validate text and mask its email addresses from a single scan.
+        
+        Args:
+            text: Text to validate and mask
+            
+        Returns:
+            Tuple of the GuardrailResult and the masked text (unchanged when
+            masking is disabled)
+        """
+        if not text:
+            return self.validate(text), text
+        
+        spans = self._find_email_spans(text)
+        return self.finalize(spans), self.mask_text(text, spans=spans)
+    
+    def _mask_run(self, length: int) -> str:
+        """Return `length` mask characters, from the precomputed table when possible."""
+        if length < len(self._mask_cache):
+            return self._mask_cache[length]
+        return self.mask_char * length
+    
+    def _mask_email(self, email: str) -> str:
+        """Mask a single email address."""
+        username, _, domain = email.partition('@')
+        mask_run = self._mask_run
+        
+        # Mask username (keep first and last character)
+        if len(username) <= 2:
+            masked_username = mask_run(len(username))
+        else:
+            masked_username = f"{username[0]}{mask_run(len(username) - 2)}{username[-1]}"
+        
+        # Mask domain (keep first character of each part)
+        masked_domain = '.'.join(
+            part if len(part) <= 1 else f"{part[0]}{mask_run(len(part) - 1)}"
+            for part in domain.split('.')
+        )
+        return f"{masked_username}@{masked_domain}"
+    
+    def mask_text(self, text: str, spans: Optional[List[Tuple[int, int, str]]] = None) -> str:
         """
         Mask email addresses in text.
         
         Args:
             text: Text containing email addresses
+            spans: Optional (start, end, email) spans from `validate()` for this exact
+                text, used to skip a second regex scan
             
         Returns:
             Text with masked email addresses
         """
-        if not self.mask_emails:
+        if not self.mask_emails or '@' not in text:
             return text
         
-        def mask_email(match):
-            email = match.group(0)
-            parts = email.split('@')
-            username = parts[0]
-            domain = parts[1]
-            
-            # Mask username (keep first and last character)
-            if len(username) <= 2:
-                masked_username = self.mask_char * len(username)
-            else:
-                masked_username = username[0] + self.mask_char * (len(username) - 2) + username[-1]
-            
-            # Mask domain (keep first character of each part)
-            domain_parts = domain.split('.')
-            masked_domain_parts = []
-            for part in domain_parts:
-                if len(part) <= 1:
-                    masked_domain_parts.append(part)
-                else:
-                    masked_domain_parts.append(part[0] + self.mask_char * (len(part) - 1))
-            
-            masked_domain = '.'.join(masked_domain_parts)
-            return f"{masked_username}@{masked_domain}"
+        if spans is None:
+            spans = self._find_email_spans(text)
         
-        return self.email_pattern.sub(mask_email, text)
+        if not spans:
+            return text
+        
+        if self._use_mask_kernel and text.isascii():
+            return _jit_mask_text(text, spans, self.mask_char)
+        
+        buffer = io.StringIO()
+        position = 0
+        for start, end, email in spans:
+            buffer.write(text[position:start])
+            buffer.write(self._mask_email(email))
+            position = end
+        buffer.write(text[position:])
+        return buffer.getvalue()
 
 
 class GuardrailManager:
@@ -253,10 +527,154 @@ class GuardrailManager:
             guardrails: List of guardrail instances
         """
         self.guardrails = guardrails or []
+        self._combined = None
+        self._pattern_set = None
     
     def add_guardrail(self, guardrail: Any) -> None:
         """Add a guardrail to the manager."""
         self.guardrails.append(guardrail)
+        self._combined = None
+        self._pattern_set = None
+    
+    def _build_pattern_set(self) -> Tuple[Any, Dict[int, int]]:
+        """
+        Compile the patterns of all pattern-based guardrails into one RE2 set.
+        
+        Returns the set (or None when RE2 is unavailable or nothing can be added)
+        and a mapping from guardrail index to its pattern's id in the set.
+        """
+        if re2 is None:
+            return None, {}
+        
+        pattern_ids = {}
+        set_index_for_guardrail = {}
+        try:
+            pattern_set = re2.Set.SearchSet()
+            for index, guardrail in enumerate(self.guardrails):
+                pattern = getattr(guardrail, "pattern", None)
+                if pattern is None or not hasattr(guardrail, "finalize"):
+                    continue
+                if pattern not in pattern_ids:
+                    pattern_ids[pattern] = pattern_set.Add(pattern)
+                set_index_for_guardrail[index] = pattern_ids[pattern]
+            if not set_index_for_guardrail:
+                return None, {}
+            pattern_set.Compile()
+        except Exception:
+            # A pattern RE2 cannot compile; scan with each guardrail instead
+            return None, {}
+        return pattern_set, set_index_for_guardrail
+    
+    def _build_combined_pattern(self) -> Tuple[Optional[re.Pattern], Dict[str, List[int]]]:
+        """
+        Compile one alternation over the patterns of all pattern-based guardrails,
+        with RE2 when installed, like the individual guardrail patterns.
+        
+        Guardrails sharing a pattern share a named group, so each group maps to
+        the indices of the guardrails that should receive its matches.
+        """
+        group_for_pattern = {}
+        group_members = {}
+        for index, guardrail in enumerate(self.guardrails):
+            pattern = getattr(guardrail, "pattern", None)
+            if pattern is None or not hasattr(guardrail, "finalize"):
+                continue
+            group = group_for_pattern.setdefault(pattern, f"g{len(group_for_pattern)}")
+            group_members.setdefault(group, []).append(index)
+        
+        if not group_for_pattern:
+            return None, group_members
+        combined = _compile_regex(
+            "|".join(f"(?P<{group}>{pattern})" for pattern, group in group_for_pattern.items())
+        )
+        return combined, group_members
+    
+    def validate_combined(self, text: str) -> List[GuardrailResult]:
+        """
+        Run all guardrails on the given text with a single regex scan.
+        
+        Guardrails that expose a `pattern` and `finalize()` are matched together
+        through one combined alternation; any other guardrail falls back to its
+        own `validate()`. Matches do not overlap across different patterns.
+        
+        Args:
+            text: Text to validate
+            
+        Returns:
+            List of guardrail results, in guardrail order
+        """
+        if not text:
+            return self.validate(text)
+        
+        if self._combined is None:
+            self._combined = self._build_combined_pattern()
+        combined, group_members = self._combined
+        
+        spans = {index: [] for members in group_members.values() for index in members}
+        if combined is not None:
+            for match in combined.finditer(text):
+                span = (match.start(), match.end(), match.group(0))
+                for index in group_members[match.lastgroup]:
+                    spans[index].append(span)
+        
+        return [
+            guardrail.finalize(spans[index]) if index in spans else guardrail.validate(text)
+            for index, guardrail in enumerate(self.guardrails)
+        ]
+    
+    def validate_many(self, texts: List[str]) -> List[List[GuardrailResult]]:
+        """
+        Run all guardrails on several texts with a single regex scan.
+        
+        The texts are joined with a NUL separator and scanned once with the
+        combined pattern used by `validate_combined`; each match is then
+        assigned back to its text by position. If a text contains the
+        separator or a match runs across it, each text is scanned on its own.
+        
+        Args:
+            texts: Texts to validate, e.g. an agent's input and output
+            
+        Returns:
+            One list of guardrail results per text, in input order
+        """
+        if any(_TEXT_SEPARATOR in text for text in texts):
+            return [self.validate_combined(text) for text in texts]
+        
+        if self._combined is None:
+            self._combined = self._build_combined_pattern()
+        combined, group_members = self._combined
+        
+        pattern_indices = [index for members in group_members.values() for index in members]
+        spans = [{index: [] for index in pattern_indices} for _ in texts]
+        if combined is not None and texts:
+            # Offset of each text inside the joined string
+            starts = []
+            offset = 0
+            for text in texts:
+                starts.append(offset)
+                offset += len(text) + 1
+            
+            for match in combined.finditer(_TEXT_SEPARATOR.join(texts)):
+                segment = bisect_right(starts, match.start()) - 1
+                start = match.start() - starts[segment]
+                end = match.end() - starts[segment]
+                if end > len(texts[segment]):
+                    # The match crossed into the next text; fall back to one scan per text
+                    return [self.validate_combined(text) for text in texts]
+                span = (start, end, match.group(0))
+                for index in group_members[match.lastgroup]:
+                    spans[segment][index].append(span)
+        
+        results = []
+        for text, text_spans in zip(texts, spans):
+            if not text:
+                results.append(self.validate(text))
+                continue
+            results.append([
+                guardrail.finalize(text_spans[index]) if index in text_spans else guardrail.validate(text)
+                for index, guardrail in enumerate(self.guardrails)
+            ])
+        return results
     
     def validate(self, text: str) -> List[GuardrailResult]:
         """
@@ -268,6 +686,24 @@ class GuardrailManager:
         Returns:
             List of guardrail results
         """
+        if text and re2 is not None:
+            if self._pattern_set is None:
+                self._pattern_set = self._build_pattern_set()
+            pattern_set, set_index_for_guardrail = self._pattern_set
+            
+            if pattern_set is not None:
+                # One pass over the text tells which patterns match at all; only
+                # those guardrails need to scan for the individual matches
+                fired = set(pattern_set.Match(text) or ())
+                results = []
+                for index, guardrail in enumerate(self.guardrails):
+                    set_index = set_index_for_guardrail.get(index)
+                    if set_index is not None and set_index not in fired:
+                        results.append(guardrail.finalize([]))
+                    else:
+                        results.append(guardrail.validate(text))
+                return results
+        
         results = []
         for guardrail in self.guardrails:
             result = guardrail.validate(text)
@@ -290,12 +726,59 @@ class GuardrailManager:
         """
         results = self.validate(text)
         
-        # Log results to Opik
-        triggered_results = [r for r in results if r.triggered]
-        all_entities = []
+        # Handle triggered guardrails
+        processed_text = text
+        blocking_result = None
+        for index, result in enumerate(results):
+            if not result.triggered:
+                continue
+            if result.action == GuardrailAction.BLOCK:
+                blocking_result = result
+                break
+            elif result.action == GuardrailAction.WARN:
+                logger.warning("Guardrail triggered: %s", result.message)
+                # If it's an email guardrail and masking is enabled, mask the text
+                guardrail = self.guardrails[index]
+                if isinstance(guardrail, EmailGuardrail) and guardrail.mask_emails:
+                    # The spans found during validation locate the emails only while
+                    # the text is unmodified; otherwise mask_text scans again
+                    spans = result.details["spans"] if processed_text is text else None
+                    processed_text = guardrail.mask_text(processed_text, spans=spans)
+            elif result.action == GuardrailAction.LOG:
+                logger.info("Guardrail logged: %s", result.message)
+        
+        # Log results to Opik once the outcome, including any masking, is known
+        if OPIK_TRACING_ENABLED:
+            self._update_span(span_name, results, processed_text is not text)
+        
+        if blocking_result is not None:
+            raise GuardrailValidationFailed(
+                f"Guardrail validation failed: {blocking_result.message}",
+                blocking_result
+            )
+        
+        return processed_text
+    
+    def _update_span(self, span_name: str, results: List[GuardrailResult], text_modified: bool) -> None:
+        """Record guardrail results on the current Opik span, building the metadata only when needed."""
+        triggered_count = sum(1 for r in results if r.triggered)
+        all_entities = set()
         for result in results:
             if result.entities_found:
-                all_entities.extend(result.entities_found)
+                all_entities.update(result.entities_found)
+        
+        # Nothing triggered and nothing found is the common case; record only the run count
+        if not triggered_count and not all_entities:
+            try:
+                opik_context.update_current_span(
+                    name=span_name,
+                    metadata={"guardrails_run": len(results)}
+                )
+            except Exception as e:
+                # Silently handle errors when updating spans
+                # This prevents guardrail errors from breaking the main application
+                pass
+            return
         
         # Update Opik context
         try:
@@ -303,15 +786,15 @@ class GuardrailManager:
                 name=span_name,
                 metadata={
                     "guardrails_run": len(results),
-                    "guardrails_triggered": len(triggered_results),
-                    "entities_found": list(set(all_entities)),
-                    "text_modified": processed_text != text,
-                    "masking_applied": processed_text != text,
+                    "guardrails_triggered": triggered_count,
+                    "entities_found": list(all_entities),
+                    "text_modified": text_modified,
+                    "masking_applied": text_modified,
                     "validation_phase": "general",
                     "results": [
                         {
-                            "action": result.action.value,
-                            "severity": result.severity.value,
+                            "action": ACTION_VALUES[result.action],
+                            "severity": SEVERITY_VALUES[result.severity],
                             "triggered": result.triggered,
                             "message": result.message,
                             "entities_found": result.entities_found,
@@ -325,31 +808,6 @@ class GuardrailManager:
             # Silently handle errors when updating spans
             # This prevents guardrail errors from breaking the main application
             pass
-        
-        # Handle triggered guardrails
-        processed_text = text
-        for result in triggered_results:
-            if result.action == GuardrailAction.BLOCK:
-                raise GuardrailValidationFailed(
-                    f"Guardrail validation failed: {result.message}",
-                    result
-                )
-            elif result.action == GuardrailAction.WARN:
-                print(f"[WARNING] Guardrail triggered: {result.message}")
-                # If it's an email guardrail and masking is enabled, mask the text
-                if hasattr(result, 'mask_emails') and result.mask_emails:
-                    processed_text = self._mask_emails_in_text(processed_text)
-            elif result.action == GuardrailAction.LOG:
-                print(f"[INFO] Guardrail logged: {result.message}")
-        
-        return processed_text
-    
-    def _mask_emails_in_text(self, text: str) -> str:
-        """Helper method to mask emails in text."""
-        for guardrail in self.guardrails:
-            if isinstance(guardrail, EmailGuardrail) and guardrail.mask_emails:
-                text = guardrail.mask_text(text)
-        return text
 
 
 # Convenience functions for easy integration
@@ -5,95 +5,245 @@ Tools for running RAG workflows on the FHIR graph database
 """
 
 import asyncio
+import atexit
+import hashlib
 import os
-from textwrap import dedent
+import shelve
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 
 import lancedb
+import polars as pl
 from dotenv import load_dotenv
 from lancedb.embeddings import get_registry
 from lancedb.rerankers import RRFReranker
 
 import utils
 from baml_client.async_client import b
+from baml_instrumentation import acquire_rate_limit
 
 load_dotenv()
 os.environ["BAML_LOG"] = "WARN"
 # Set embedding registry in LanceDB to use ollama
 embedding_model = get_registry().get("ollama").create(name="nomic-embed-text")
-kuzu_db_manager = utils.KuzuDatabaseManager("fhir_db.kuzu")
 
 # Set OpenRouter API key
 os.environ["OPENROUTER_API_KEY"] = os.getenv("OPENROUTER_API_KEY")
 
+# LRU caches for LLM results of repeated questions. The Kuzu database is opened
+# read-only, so the schema these results depend on can't change while running.
+LLM_CACHE_SIZE = 512
+_pruned_schema_cache: OrderedDict[tuple[str, str], str] = OrderedDict()
+_entity_keywords_cache: OrderedDict[tuple[str, str], utils.EntityKeywords] = OrderedDict()
+_cypher_cache: OrderedDict[tuple[str, str, str], object] = OrderedDict()
+
+# Optional on-disk cache behind the LRU caches, so repeated questions also skip the LLM
+# after a restart (e.g. when re-running the UI demo). Its keys include the schema XML, so
+# a rebuilt database doesn't reuse stale results. Set RAG_CACHE_PATH to enable it.
+RAG_CACHE_PATH = os.environ.get("RAG_CACHE_PATH")
+_llm_result_cache = shelve.open(RAG_CACHE_PATH) if RAG_CACHE_PATH else None
+if _llm_result_cache is not None:
+    atexit.register(_llm_result_cache.close)
+
+
+def _llm_cache_key(kind: str, key: tuple[str, ...]) -> str:
+    """Key a result in the on-disk cache by a hash of its inputs."""
+    digest = hashlib.sha1("\x00".join(key).encode()).hexdigest()
+    return f"{kind}:{digest}"
+
+
+def _cache_get(cache: OrderedDict, kind: str, key: tuple[str, ...]):
+    """Return the cached value for `key` (None on a miss), marking it recently used."""
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    elif _llm_result_cache is not None:
+        value = _llm_result_cache.get(_llm_cache_key(kind, key))
+        if value is not None:
+            _cache_put(cache, kind, key, value, persist=False)
+    return value
+
+
+def _cache_put(
+    cache: OrderedDict, kind: str, key: tuple[str, ...], value, persist: bool = True
+) -> None:
+    """Store `value`, evicting the least recently used entry once the cache is full."""
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > LLM_CACHE_SIZE:
+        cache.popitem(last=False)
+    if persist and _llm_result_cache is not None:
+        _llm_result_cache[_llm_cache_key(kind, key)] = value
+
+
+# Most rows of a Cypher query result passed on to the LLM
+MAX_GRAPH_RESULT_ROWS = 200
+# Context for the graph answer; written unindented so no dedent() is needed per call
+GRAPH_CONTEXT_TEMPLATE = "<CYPHER>\n{query}\n</CYPHER>\n\n<RESULT>\n{result}\n</RESULT>\n"
+
+# LanceDB notes table, opened once per event loop and shared by all queries;
+# the reranker is stateless, so a single instance is reused as well
+LANCEDB_TABLE_NAME = "notes"
+# Probe 8 of the index's 64 IVF partitions (see generate_note_embeddings.py)
+VECTOR_SEARCH_NPROBES = 8
+VECTOR_SEARCH_REFINE_FACTOR = 10
+_notes_table_task: asyncio.Task | None = None
+reranker = RRFReranker()
+
+
+async def _open_notes_table():
+    lancedb_db_manager = await lancedb.connect_async("./fhir_lance_db")
+    return await lancedb_db_manager.open_table(LANCEDB_TABLE_NAME)
+
+
+async def get_notes_table():
+    """Return the shared LanceDB notes table, opening it on first use in the running loop."""
+    global _notes_table_task
+    loop = asyncio.get_running_loop()
+    if _notes_table_task is None or _notes_table_task.get_loop() is not loop:
+        _notes_table_task = loop.create_task(_open_notes_table())
+    try:
+        # Shield the shared task so a cancelled caller doesn't cancel it for everyone else
+        return await asyncio.shield(_notes_table_task)
+    except Exception:
+        # Retry on the next call rather than caching the failure
+        if _notes_table_task.done():
+            _notes_table_task = None
+        raise
+
+
+# The Kuzu database is opened on first use rather than at import time, so importing
+# this module (e.g. from the UI or the tests) stays cheap
+_kuzu_db_manager: utils.KuzuDatabaseManager | None = None
+_kuzu_db_manager_lock = threading.Lock()
+
+
+def get_kuzu_db_manager() -> utils.KuzuDatabaseManager:
+    global _kuzu_db_manager
+    if _kuzu_db_manager is None:
+        with _kuzu_db_manager_lock:
+            if _kuzu_db_manager is None:
+                _kuzu_db_manager = utils.KuzuDatabaseManager("fhir_db.kuzu")
+    return _kuzu_db_manager
+
+
+def get_full_schema_xml() -> str:
+    # Built once by the (read-only) database manager and reused for every question
+    return get_kuzu_db_manager().full_schema_xml
 
-async def prune_schema(question: str) -> str:
 
-    schema = kuzu_db_manager.get_schema_dict
-    schema_xml = kuzu_db_manager.get_schema_xml(schema)
+async def warm_up() -> None:
+    """
+    Open the databases and build the full schema XML before the first question.
 
+    The Kuzu work is blocking, so it runs in a worker thread while the LanceDB
+    table is opened on the event loop.
+    """
+    await asyncio.gather(asyncio.to_thread(get_full_schema_xml), get_notes_table())
+
+
+async def prune_schema(question: str) -> str:
+    schema_xml = get_full_schema_xml()
+    schema_key = (question, schema_xml)
+    cached = _cache_get(_pruned_schema_cache, "prune_schema", schema_key)
+    if cached is not None:
+        print("Reused pruned schema XML")
+        return cached
+
+    await acquire_rate_limit()
     pruned_schema = await b.PruneSchema(schema_xml, question)
 
-    pruned_schema_xml = kuzu_db_manager.get_schema_xml(pruned_schema.model_dump())
+    pruned_schema_xml = get_kuzu_db_manager().get_schema_xml(pruned_schema.model_dump())
+    _cache_put(_pruned_schema_cache, "prune_schema", schema_key, pruned_schema_xml)
 
     print("Generated pruned schema XML")
     return pruned_schema_xml
 
 
 async def answer_question(question: str, context: str) -> str:
+    await acquire_rate_limit()
     answer = await b.AnswerQuestion(question, context)
     
     return answer
 
 
+async def generate_cypher(question: str, schema_xml: str, important_entities: str):
+    cypher_key = (question, schema_xml, important_entities)
+    response_cypher = _cache_get(_cypher_cache, "text2cypher", cypher_key)
+    if response_cypher is None:
+        await acquire_rate_limit()
+        response_cypher = await b.Text2Cypher(question, schema_xml, important_entities)
+        _cache_put(_cypher_cache, "text2cypher", cypher_key, response_cypher)
+    return response_cypher
+
+
 async def execute_graph_rag(question: str, schema_xml: str, important_entities: str) -> str:
-    response_cypher = await b.Text2Cypher(question, schema_xml, important_entities)
+    response_cypher = await generate_cypher(question, schema_xml, important_entities)
     
     if response_cypher.cypher:
         # Run the Cypher query on the graph database
-        conn = kuzu_db_manager.get_connection()
+        conn = get_kuzu_db_manager().get_connection()
         query = response_cypher.cypher
-        response = conn.execute(query)
-        result = response.get_as_pl().to_dicts()  # type: ignore
-        print("Ran Cypher query")
+        # Kuzu queries are blocking; run them off the event loop so concurrent
+        # RAG tasks (e.g. the vector search) keep making progress
+        try:
+            response = await asyncio.to_thread(conn.execute, query)
+            # Serialize from the Arrow-backed frame rather than building a dict per row,
+            # capping the rows so the LLM context stays bounded
+            result_df = response.get_as_pl()  # type: ignore
+            result = result_df.head(MAX_GRAPH_RESULT_ROWS).write_json()
+            print("Ran Cypher query")
+        except RuntimeError as e:
+            # Generated Cypher can be invalid for the schema; answer from an empty result
+            # rather than failing the whole question
+            print(f"[WARNING]: Cypher query failed: {e}")
+            result = ""
     else:
         print("No Cypher query was generated from the given question and schema")
         result = ""
         query = ""
     
-    context = dedent(
-        f"""
-        <CYPHER>
-        {query}
-        </CYPHER>
-
-        <RESULT>
-        {result}
-        </RESULT>
-        """
-    )
+    context = GRAPH_CONTEXT_TEMPLATE.format(query=query, result=result)
     
     answer = await answer_question(question, context)
     return answer
 
 
+@lru_cache(maxsize=512)
+def embed_query(text: str) -> list[float]:
+    """Embed a search query with the Ollama model; repeated queries reuse the vector."""
+    return embedding_model.compute_query_embeddings(text)[0]
+
+
 async def execute_vector_and_fts_rag(
     question: str, schema_xml: str, important_entities: str, top_k: int = 2
 ) -> str:
-    lancedb_table_name = "notes"
-    lancedb_db_manager = await lancedb.connect_async("./fhir_lance_db")
-    async_tbl = await lancedb_db_manager.open_table(lancedb_table_name)
-    reranker = RRFReranker()
+    async_tbl = await get_notes_table()
     
     if important_entities:
-        response = await async_tbl.search(important_entities, query_type="hybrid")
+        # Embed on the client (cached per entity string) and build the hybrid query from
+        # the vector and the FTS text, instead of having the table embed the text per query
+        query_vector = await asyncio.to_thread(embed_query, important_entities)
+        # With the IVF_PQ index, probe a few partitions and re-rank the candidates on the
+        # full vectors to keep recall; both settings are ignored by a flat search
+        response = (
+            async_tbl.query()
+            .nearest_to(query_vector)
+            .nprobes(VECTOR_SEARCH_NPROBES)
+            .refine_factor(VECTOR_SEARCH_REFINE_FACTOR)
+            .nearest_to_text(important_entities)
+        )
         response_polars = (
             await response.rerank(reranker=reranker)
             .limit(top_k)
-            .select(["record_id", "note"])
+            .select(["note"])
             .to_polars()
         )
-        response_dicts = response_polars.to_dicts()
-        context = " ".join([f"{row['note']}\n" for row in response_dicts])
+        # Join the non-empty notes in Polars rather than going through a dict per row
+        context = response_polars.select(
+            pl.col("note").filter(pl.col("note") != "").str.join("\n")
+        ).item()
         print("Generated vector context")
         
     else:
@@ -103,37 +253,76 @@ async def execute_vector_and_fts_rag(
     return context
 
 
-async def get_vector_context(question, pruned_schema_xml, important_entities, top_k=2):
-    return await execute_vector_and_fts_rag(question, pruned_schema_xml, important_entities, top_k)
+async def extract_entity_keywords(question: str, pruned_schema_xml: str) -> utils.EntityKeywords:
+    entities_key = (question, pruned_schema_xml)
+    entity_keywords = _cache_get(_entity_keywords_cache, "entity_keywords", entities_key)
+    if entity_keywords is None:
+        await acquire_rate_limit()
+        entities = await b.ExtractEntityKeywords(question, pruned_schema_xml)
+        entity_keywords = utils.EntityKeywords.from_entities(entities)
+        _cache_put(_entity_keywords_cache, "entity_keywords", entities_key, entity_keywords)
+    
+    return entity_keywords
 
 
-async def get_graph_answer(question, pruned_schema_xml, important_entities):
-    return await execute_graph_rag(question, pruned_schema_xml, important_entities)
+# Opt-in: search the notes with the question itself while the schema is pruned and the
+# entities are extracted, and keep that result when the question names every extracted
+# entity. This changes retrieval: the whole question is embedded and used for FTS instead
+# of the extracted keyword string, so it is off by default.
+SPECULATIVE_VECTOR_SEARCH = os.environ.get("SPECULATIVE_VECTOR_SEARCH", "false").lower() == "true"
 
 
-async def extract_entity_keywords(question: str, pruned_schema_xml: str):
-    entities = await b.ExtractEntityKeywords(question, pruned_schema_xml)
-    
-    return entities
+def _question_mentions_entities(question: str, entities) -> bool:
+    """Whether every extracted entity value appears verbatim in the question."""
+    lowered_question = question.lower()
+    return all(str(entity.value).lower() in lowered_question for entity in entities)
+
+
+def _discard_task(task: asyncio.Task) -> None:
+    """Cancel a task whose result is no longer needed, retrieving any exception it raised."""
+    task.cancel()
+    task.add_done_callback(lambda done: done.cancelled() or done.exception())
 
 
-async def run_hybrid_rag(question: str) -> tuple[str, str]:
+async def run_hybrid_rag(question: str) -> utils.HybridRAGResult:
     print(f"---\nQ: {question}")
     
-    pruned_schema_xml = await prune_schema(question)
-    entities = await extract_entity_keywords(question, pruned_schema_xml)
-    important_entities = " ".join(
-        [f"{entity.key} {entity.value}".replace("_", " ") for entity in entities]
-    )
+    speculative_context_task = None
+    if SPECULATIVE_VECTOR_SEARCH:
+        # The vector search doesn't use the schema, so it runs alongside both schema
+        # pruning and entity extraction
+        speculative_context_task = asyncio.create_task(
+            execute_vector_and_fts_rag(question, "", question)
+        )
+    try:
+        pruned_schema_xml = await prune_schema(question)
+        entity_keywords = await extract_entity_keywords(question, pruned_schema_xml)
+    except BaseException:
+        if speculative_context_task is not None:
+            _discard_task(speculative_context_task)
+        raise
+    entities, important_entities = entity_keywords
     
-    # Start both RAG tasks concurrently
-    vector_context_task = asyncio.create_task(
-        get_vector_context(question, pruned_schema_xml, important_entities)
-    )
+    # Start the graph RAG task right away
     graph_answer_task = asyncio.create_task(
-        get_graph_answer(question, pruned_schema_xml, important_entities)
+        execute_graph_rag(question, pruned_schema_xml, important_entities)
     )
     
+    # The speculative result is only kept when it searched with the keyword string itself,
+    # or (the opt-in heuristic) when the question names every extracted entity; otherwise
+    # search with the extracted entities
+    if speculative_context_task is not None and (
+        important_entities == question
+        or (entities and _question_mentions_entities(question, entities))
+    ):
+        vector_context_task = speculative_context_task
+    else:
+        if speculative_context_task is not None:
+            _discard_task(speculative_context_task)
+        vector_context_task = asyncio.create_task(
+            execute_vector_and_fts_rag(question, pruned_schema_xml, important_entities)
+        )
+    
     # As soon as vector context is ready, start answer generation
     vector_context = await vector_context_task
     vector_answer_task = asyncio.create_task(answer_question(question, vector_context))
@@ -141,10 +330,11 @@ async def run_hybrid_rag(question: str) -> tuple[str, str]:
     # Await both vector answer generation and graph answer generation before returning
     vector_answer, graph_answer = await asyncio.gather(vector_answer_task, graph_answer_task)
     
-    return vector_answer, graph_answer
+    return utils.HybridRAGResult(vector_answer, graph_answer)
 
 
 async def synthesize_answers(question: str, vector_answer: str, graph_answer: str) -> str:
+    await acquire_rate_limit()
     synthesized_answer = await b.SynthesizeAnswers(question, vector_answer, graph_answer)
         
     return synthesized_answer
@@ -155,7 +345,22 @@ async def main(question: str) -> None:
     print(f"A1: {vector_answer}A2: {graph_answer}")
     synthesized_answer = await synthesize_answers(question, vector_answer, graph_answer)
     print(f"Final answer: {synthesized_answer}")
-    
+
+
+# Questions are independent, so several run at once; the semaphore keeps the number
+# of in-flight LLM requests within the provider's rate limits
+MAX_CONCURRENT_QUESTIONS = 4
+
+
+async def run_questions(questions: list[str], max_concurrency: int = MAX_CONCURRENT_QUESTIONS) -> None:
+    await warm_up()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(question: str) -> None:
+        async with semaphore:
+            await main(question)
+
+    await asyncio.gather(*(run_one(question) for question in questions))
 
 
 if __name__ == "__main__":
@@ -171,5 +376,4 @@ if __name__ == "__main__":
         "How many patients are immunized for influenza?",
         "How many substances cause allergies in the category 'food'?",
     ]
-    for question in questions:
-        asyncio.run(main(question))
+    asyncio.run(run_questions(questions))
@@ -1,6 +1,10 @@
+import asyncio
+import re
+
 import pytest
+import pytest_asyncio
 
-from rag import run_hybrid_rag
+from rag import MAX_CONCURRENT_QUESTIONS, run_hybrid_rag, warm_up
 from tests import test_data
 
 NUMBER_WORDS = {
@@ -16,6 +20,7 @@ NUMBER_WORDS = {
     "nine": "9",
     "ten": "10",  # ...add more as needed
 }
+NUM_TO_WORD = {num: word for word, num in NUMBER_WORDS.items()}
 
 
 def number_variants(s: str) -> list[str]:
@@ -26,28 +31,62 @@ def number_variants(s: str) -> list[str]:
     """
     s = s.lower()
     if s.isdigit():
-        for word, num in NUMBER_WORDS.items():
-            if num == s:
-                return [s, word]
-        return [s]
+        return [s, NUM_TO_WORD[s]] if s in NUM_TO_WORD else [s]
     elif s in NUMBER_WORDS:
         return [s, NUMBER_WORDS[s]]
     return [s]
 
 
-@pytest.mark.asyncio
-@pytest.mark.parametrize("test_case", test_data.test_cases)
-async def test_graphrag_eval_expected_answer(test_case):
-    vector_answer, graph_answer = await run_hybrid_rag(test_case["question"])
-    assert vector_answer is not None
-    assert graph_answer is not None
-    answer_str = str(graph_answer).lower()
-    found = False
-    for expected in test_case["expected_values"]:
-        variants = number_variants(expected)
-        if any(variant in answer_str for variant in variants):
-            found = True
-            break
+def expected_values_pattern(expected_values: tuple[str, ...]) -> re.Pattern:
+    """
+    Compile every variant of the expected values into a single alternation, so the answer
+    is scanned once per test rather than once per variant.
+    """
+    variants = {variant for expected in expected_values for variant in number_variants(expected)}
+    return re.compile("|".join(re.escape(variant) for variant in sorted(variants)))
+
+
+# Built once at import time, alongside the test cases they belong to
+EXPECTED_PATTERNS = [
+    expected_values_pattern(test_case.expected_values) for test_case in test_data.test_cases
+]
+
+
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def hybrid_rag_results() -> dict:
+    """
+    Run every test question through the hybrid RAG workflow concurrently, once per module.
+    The questions are LLM-bound, so the parametrized tests below only check the answers
+    rather than waiting on each question in turn.
+    """
+    await warm_up()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUESTIONS)
+
+    async def run_one(question: str):
+        async with semaphore:
+            return await run_hybrid_rag(question)
+
+    questions = [test_case.question for test_case in test_data.test_cases]
+    # Keep failures per question, so one failing question doesn't fail every test case
+    results = await asyncio.gather(
+        *(run_one(question) for question in questions), return_exceptions=True
+    )
+    return dict(zip(questions, results))
+
+
+@pytest.mark.parametrize(
+    "test_case, expected_pattern",
+    list(zip(test_data.test_cases, EXPECTED_PATTERNS)),
+    ids=[test_case.question[:40] for test_case in test_data.test_cases],
+)
+def test_graphrag_eval_expected_answer(test_case, expected_pattern, hybrid_rag_results):
+    result = hybrid_rag_results[test_case.question]
+    if isinstance(result, BaseException):
+        raise result
+    # Read the answers by name so the expected values are checked against the graph branch
+    assert result.vector_answer is not None
+    assert result.graph_answer is not None
+    answer_str = str(result.graph_answer).lower()
     assert (
-        found
-    ), f"None of the expected values {test_case['expected_values']} found in answer: {answer_str}"
+        expected_pattern.search(answer_str) is not None
+    ), f"None of the expected values {list(test_case.expected_values)} found in answer: {answer_str}"
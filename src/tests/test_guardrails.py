@@ -0,0 +1,104 @@
+"""
+Tests for the email guardrail's matching, batching and masking
+"""
+
+import pytest
+
+from guardrails import _EMAIL_RE, EmailGuardrail, GuardrailManager
+
+# Emails joined by local-part characters (".", "-", "+", "_", "%"), where a later match
+# starts inside the characters an earlier match could also have consumed
+ADJACENT_EMAIL_TEXTS = [
+    "a@b.com.c@d.org",
+    "a@b.com-c@d.org",
+    "a@b.com+c@d.org",
+    "a@b.com_c@d.org",
+    "a@b.com%c@d.org",
+    "x.y@mail.example.org.first.last@foo.io and z@bar.net",
+    "first@one.com second@two.net",
+    "no email here",
+    "a stray @ sign",
+]
+
+
+def regex_spans(text: str) -> list[tuple[int, int, str]]:
+    return [(m.start(), m.end(), m.group(0)) for m in _EMAIL_RE.finditer(text)]
+
+
+@pytest.mark.parametrize("text", ADJACENT_EMAIL_TEXTS)
+def test_email_spans_match_regex(text):
+    # With Hyperscan installed this also checks that its prefilter drops no email
+    assert EmailGuardrail()._find_email_spans(text) == regex_spans(text)
+
+
+def make_manager() -> GuardrailManager:
+    # Two guardrails share the default pattern (and so a combined group); one blocks domains
+    return GuardrailManager([
+        EmailGuardrail(),
+        EmailGuardrail(blocked_domains=["evil.com"], block_common_domains=True),
+    ])
+
+
+BATCH_TEXTS = [
+    "no at sign here",
+    "a stray @ sign",
+    "contact john.doe@example.com or admin@gmail.com today",
+    "x@evil.com",
+    "ends with someone@mail.example.org",
+    "",
+    "a@b.com.c@d.org",
+]
+
+
+@pytest.mark.parametrize("text", BATCH_TEXTS)
+def test_validate_matches_each_guardrail(text):
+    # With RE2 installed, the manager pre-screens the text with a pattern set first
+    manager = make_manager()
+    assert manager.validate(text) == [guardrail.validate(text) for guardrail in manager.guardrails]
+
+
+@pytest.mark.parametrize("text", BATCH_TEXTS)
+def test_validate_combined_matches_validate(text):
+    manager = make_manager()
+    assert manager.validate_combined(text) == manager.validate(text)
+
+
+@pytest.mark.parametrize(
+    "texts",
+    [
+        BATCH_TEXTS,
+        # Emails at both ends of adjacent texts, which are joined by the separator
+        ["a@b.com", "c@d.org", "e@f.net"],
+        ["first@one.com", "", "second@two.net"],
+        ["no emails", "still none"],
+        [],
+    ],
+)
+def test_validate_many_matches_validate(texts):
+    manager = make_manager()
+    assert manager.validate_many(texts) == [manager.validate(text) for text in texts]
+
+
+MASK_TEXTS = [
+    "contact john.doe@example.com or admin@gmail.com today",
+    "a@b.com.c@d.org",
+    "ends with someone@mail.example.org",
+    "no emails here",
+]
+
+
+def test_mask_text_literal():
+    guardrail = EmailGuardrail(mask_emails=True)
+    assert guardrail.mask_text("mail john.doe@example.com") == "mail j******e@e******.c**"
+
+
+@pytest.mark.parametrize("text", MASK_TEXTS)
+def test_mask_text_with_and_without_spans(text):
+    guardrail = EmailGuardrail(mask_emails=True)
+    spans = guardrail.validate(text).details["spans"]
+    # Masking each regex match on its own is the reference, whichever masking path runs
+    expected = text
+    for start, end, email in reversed(regex_spans(text)):
+        expected = expected[:start] + guardrail._mask_email(email) + expected[end:]
+    assert guardrail.mask_text(text) == expected
+    assert guardrail.mask_text(text, spans=spans) == expected
@@ -1,14 +1,21 @@
 import asyncio
 import io
+import queue
+import threading
 
 import streamlit as st
 
-from baml_client.async_client import b
 from rag import (
+    GRAPH_CONTEXT_TEMPLATE,
+    MAX_GRAPH_RESULT_ROWS,
     answer_question,
     execute_vector_and_fts_rag,
+    extract_entity_keywords,
+    generate_cypher,
     prune_schema,
+    synthesize_answers,
 )
+from utils import KuzuDatabaseManager
 
 st.set_page_config(page_title="Hybrid RAG Interactive Demo", layout="centered")
 st.title("Hybrid (graph + vector + FTS) RAG")
@@ -23,68 +30,87 @@ run_clicked = st.button("Run", type="primary")
 
 log_buffer = io.StringIO()
 
+
+# Streamlit reruns this script on every interaction; the database is opened (and its
+# vector extension loaded) once per process and shared by all reruns and sessions
+@st.cache_resource
+def get_kuzu_manager(db_path: str) -> KuzuDatabaseManager:
+    return KuzuDatabaseManager(db_path)
+
+
+# The database is opened read-only, so a query's result never changes
+@st.cache_data(max_entries=256)
+def run_cypher(db_path: str, query: str) -> str:
+    response = get_kuzu_manager(db_path).get_connection().execute(query)
+    # Serialize from the Arrow-backed frame rather than building a dict per row; CSV names
+    # each column once instead of per row, so the context sent to the LLM stays small
+    return response.get_as_pl().head(MAX_GRAPH_RESULT_ROWS).write_csv()  # type: ignore
+
+
+# Streamlit reruns this script on every interaction; one event loop runs for the lifetime
+# of the process, so the async clients (and their HTTP connection pools) are reused by
+# every run instead of being torn down with a per-run loop
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
 # Store cypher query in session state for display
 if "cypher_query" not in st.session_state:
     st.session_state["cypher_query"] = None
 
 
-async def run_pipeline_steps(question, log_buffer, status):
-    logs = []
-    cypher_query = None
-
-    def log(msg):
-        logs.append(msg)
-        log_buffer.write(msg + "\n")
-        status.code(msg, language="text")
-
+async def run_pipeline_steps(question, log):
     log("[1/6] Pruning schema...")
     pruned_schema_xml = await prune_schema(question)
     log("[1/6] Pruned schema XML generated.")
 
     log("[2/6] Extracting entities...")
-    entities = await b.ExtractEntityKeywords(question, pruned_schema_xml)
-    important_entities = " ".join(
-        [f"{entity.key} {entity.value}".replace("_", " ") for entity in entities]
-    )
+    # prune_schema, extract_entity_keywords and generate_cypher cache their LLM results,
+    # so re-running the same question skips those calls
+    _, important_entities = await extract_entity_keywords(question, pruned_schema_xml)
     log(f"[2/6] Extracted entities: {important_entities}")
 
-    log("[3/6] Generating vector/FTS context...")
-    vector_context = await execute_vector_and_fts_rag(
-        question, pruned_schema_xml, important_entities
-    )
-    log("[3/6] Vector/FTS context generated.")
-
-    log("[4/6] Generating Cypher and graph answer...")
-    cypher_response = await b.Text2Cypher(question, pruned_schema_xml, important_entities)
-    if cypher_response.cypher:
+    # The vector and graph branches only depend on the entities, so they run concurrently
+    # and each answers as soon as its own context is ready
+    async def run_vector_branch():
+        log("[3/6] Generating vector/FTS context...")
+        vector_context = await execute_vector_and_fts_rag(
+            question, pruned_schema_xml, important_entities
+        )
+        log("[3/6] Vector/FTS context generated.")
+        vector_answer = await answer_question(question, vector_context)
+        log("[5/6] Vector answer generated.")
+        return vector_answer
+
+    async def run_graph_branch():
+        log("[4/6] Generating Cypher and graph answer...")
+        cypher_response = await generate_cypher(question, pruned_schema_xml, important_entities)
         cypher_query = cypher_response.cypher
-        st.session_state["cypher_query"] = cypher_query
-        log(f"[4/6] Cypher generated.")
-        # Run the Cypher query on the graph database
-        from utils import KuzuDatabaseManager
-
-        kuzu_db_manager = KuzuDatabaseManager("./fhir_kuzu_db")
-        conn = kuzu_db_manager.get_connection()
-        query = cypher_query
-        response = conn.execute(query)
-        result = response.get_as_pl().to_dicts()  # type: ignore
-        context = f"<CYPHER>\n{query}\n</CYPHER>\n<RESULT>\n{result}\n</RESULT>"
-        log("[4/6] Cypher query executed and result obtained.")
-    else:
-        st.session_state["cypher_query"] = None
-        log("[4/6] No Cypher query was generated.")
-        context = ""
-    graph_answer = await answer_question(question, context)
-    log("[4/6] Graph answer generated.")
-
-    log("[5/6] Generating vector answer...")
-    vector_answer = await answer_question(question, vector_context)
-    log("[5/6] Vector answer generated.")
+        if cypher_query:
+            log(f"[4/6] Cypher generated.")
+            # Run the (blocking) Cypher query on the graph database off the event loop
+            result = await asyncio.to_thread(run_cypher, "./fhir_kuzu_db", cypher_query)
+            context = GRAPH_CONTEXT_TEMPLATE.format(query=cypher_query, result=result)
+            log("[4/6] Cypher query executed and result obtained.")
+        else:
+            log("[4/6] No Cypher query was generated.")
+            context = ""
+        graph_answer = await answer_question(question, context)
+        log("[4/6] Graph answer generated.")
+        return graph_answer, cypher_query
+
+    vector_answer, (graph_answer, cypher_query) = await asyncio.gather(
+        run_vector_branch(), run_graph_branch()
+    )
 
     log("[6/6] Synthesizing final answer...")
-    synthesized_answer = await b.SynthesizeAnswers(question, vector_answer, graph_answer)
+    # Goes through rag, so the call waits for the provider's rate limit like the others
+    synthesized_answer = await synthesize_answers(question, vector_answer, graph_answer)
     log("[6/6] Final answer synthesized.")
-    return synthesized_answer, "\n".join(logs)
+    return synthesized_answer, cypher_query or None
 
 
 final_answer_container = st.empty()
@@ -94,9 +120,30 @@ if run_clicked and question.strip():
     # Reset cypher query for new run
     st.session_state["cypher_query"] = None
     with st.status("Running Hybrid RAG pipeline...", expanded=False) as status:
-        answer, logs = asyncio.run(run_pipeline_steps(question, log_buffer, status))
+        # The pipeline runs on the background loop; its progress messages come back through
+        # a queue, since Streamlit elements can only be updated from this script's thread
+        log_queue = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            run_pipeline_steps(question, log_queue.put), get_event_loop()
+        )
+        logs = []
+        # One code block that is updated in place, rather than a new block per message
+        log_view = status.empty()
+        while not (future.done() and log_queue.empty()):
+            try:
+                batch = [log_queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            # Messages that arrived together (e.g. from the concurrent branches) render once
+            while not log_queue.empty():
+                batch.append(log_queue.get_nowait())
+            logs.extend(batch)
+            log_buffer.write("".join(msg + "\n" for msg in batch))
+            log_view.code("\n".join(logs), language="text")
+        answer, cypher_query = future.result()
         status.update(label="Done!", state="complete")
-        st.session_state["logs"] = logs
+        st.session_state["cypher_query"] = cypher_query
+        st.session_state["logs"] = "\n".join(logs)
         st.session_state["final_answer"] = answer
 
 # When we have the final answer
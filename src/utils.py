@@ -2,16 +2,42 @@
 Utility functions for the Graph RAG pipeline.
 """
 
+from functools import cached_property
+from typing import NamedTuple
+
 import kuzu
 
 from baml_client import b
 
+
+class HybridRAGResult(NamedTuple):
+    """Answers from the two retrieval branches of the hybrid RAG pipeline."""
+
+    vector_answer: str
+    graph_answer: str
+
+
+class EntityKeywords(NamedTuple):
+    """Entities extracted from a question, with their search keywords joined once."""
+
+    entities: list
+    keywords: str
+
+    @classmethod
+    def from_entities(cls, entities: list) -> "EntityKeywords":
+        keywords = " ".join(f"{entity.key} {entity.value}".replace("_", " ") for entity in entities)
+        return cls(entities, keywords)
+
+
 # --- Database ---
 
 
 class KuzuDatabaseManager:
     """Manages Kuzu database connection and schema retrieval."""
 
+    # INSTALL only needs to run once per process; every new database still has to LOAD
+    _vector_extension_installed = False
+
     def __init__(self, db_path: str = "ex_kuzu_db"):
         self.db_path = db_path
         self.db = kuzu.Database(db_path, read_only=True)
@@ -19,8 +45,11 @@ class KuzuDatabaseManager:
         self._setup_vector_extension()
 
     def _setup_vector_extension(self):
-        """Install and load vector extension once."""
-        self.conn.execute("INSTALL vector; LOAD vector;")
+        """Install the vector extension once per process and load it into this database."""
+        if not KuzuDatabaseManager._vector_extension_installed:
+            self.conn.execute("INSTALL vector;")
+            KuzuDatabaseManager._vector_extension_installed = True
+        self.conn.execute("LOAD vector;")
 
     def get_connection(self) -> kuzu.Connection:
         """Get the database connection."""
@@ -33,73 +62,90 @@ class KuzuDatabaseManager:
         if hasattr(self, "db"):
             self.db.close()
 
-    @property
+    @cached_property
     def get_schema_dict(self) -> dict[str, list[dict]]:
-        # Get schema for LLM
+        # Get schema for LLM; the database is opened read-only, so it is read only once
         nodes = self.conn._get_node_table_names()
         relationships = self.conn._get_rel_table_names()
 
         schema = {"nodes": [], "edges": []}
-
-        for node in nodes:
-            node_schema = {"label": node, "properties": []}
-            node_properties = self.conn.execute(f"CALL TABLE_INFO('{node}') RETURN *;")
-            while node_properties.has_next():  # type: ignore
-                row = node_properties.get_next()  # type: ignore
-                node_schema["properties"].append({"name": row[1], "type": row[2]})
-            schema["nodes"].append(node_schema)
-
-        for rel in relationships:
-            edge = {
+        table_names = list(nodes) + [rel["name"] for rel in relationships]
+        if not table_names:
+            return schema
+
+        # One multi-statement call for every table's properties instead of one call per table
+        results = self.conn.execute(
+            " ".join(f"CALL TABLE_INFO('{name}') RETURN *;" for name in table_names)
+        )
+        if not isinstance(results, list):
+            results = [results]
+        properties = []
+        for result in results:
+            # Read the name and type columns from Arrow rather than building a row per property
+            table_info = result.get_as_arrow()  # type: ignore
+            names = table_info.column(1).to_pylist()
+            types = table_info.column(2).to_pylist()
+            properties.append([{"name": name, "type": type_} for name, type_ in zip(names, types)])
+
+        for node, node_properties in zip(nodes, properties):
+            schema["nodes"].append({"label": node, "properties": node_properties})
+
+        for rel, rel_properties in zip(relationships, properties[len(nodes):]):
+            schema["edges"].append({
                 "label": rel["name"],
                 "src": rel["src"],
                 "dst": rel["dst"],
-                "properties": [],
-            }
-            rel_properties = self.conn.execute(f"""CALL TABLE_INFO('{rel["name"]}') RETURN *;""")
-            while rel_properties.has_next():  # type: ignore
-                row = rel_properties.get_next()  # type: ignore
-                edge["properties"].append({"name": row[1], "type": row[2]})
-            schema["edges"].append(edge)
+                "properties": rel_properties,
+            })
 
         return schema
 
+    @cached_property
+    def full_schema_xml(self) -> str:
+        """XML of the full database schema, built once per manager."""
+        return self.get_schema_xml(self.get_schema_dict)
+
     def get_schema_xml(self, schema: dict[str, list[dict]]) -> str:
         """Convert the JSON schema into XML format with structure, nodes, and relationships."""
+        # Every line goes into one list that is joined once at the end. An empty section or
+        # property list keeps its blank line, so the XML is the same as when each section
+        # was joined on its own
+        edges = schema["edges"]
+        nodes = schema["nodes"]
+
         # Structure section: just relationship structure
-        structure_lines = []
-        for edge in schema["edges"]:
-            structure_lines.append(
-                f'  <rel label="{edge["label"]}" from="{edge["src"]}" to="{edge["dst"]}" />'
-            )
-        structure_xml = "<structure>\n" + "\n".join(structure_lines) + "\n</structure>"
+        lines = ["<structure>"]
+        for edge in edges:
+            lines.append(f'  <rel label="{edge["label"]}" from="{edge["src"]}" to="{edge["dst"]}" />')
+        if not edges:
+            lines.append("")
+        lines.append("</structure>")
 
         # Nodes section: node label and properties
-        node_lines = []
-        for node in schema["nodes"]:
-            prop_lines = [
-                f'    <property name="{prop["name"]}" type="{prop["type"]}" />'
-                for prop in node["properties"]
-            ]
-            node_lines.append(
-                f'  <node label="{node["label"]}">\n' + "\n".join(prop_lines) + "\n  </node>"
-            )
-        nodes_xml = "<nodes>\n" + "\n".join(node_lines) + "\n</nodes>"
+        lines.append("<nodes>")
+        for node in nodes:
+            lines.append(f'  <node label="{node["label"]}">')
+            for prop in node["properties"]:
+                lines.append(f'    <property name="{prop["name"]}" type="{prop["type"]}" />')
+            if not node["properties"]:
+                lines.append("")
+            lines.append("  </node>")
+        if not nodes:
+            lines.append("")
+        lines.append("</nodes>")
 
         # Relationships section: edge label and properties (if any)
-        rel_lines = []
-        for edge in schema["edges"]:
+        lines.append("<relationships>")
+        for edge in edges:
             if edge.get("properties"):
-                prop_lines = [
-                    f'    <property name="{prop["name"]}" type="{prop["type"]}" />'
-                    for prop in edge["properties"]
-                ]
-                rel_lines.append(
-                    f'  <rel label="{edge["label"]}">\n' + "\n".join(prop_lines) + "\n  </rel>"
-                )
+                lines.append(f'  <rel label="{edge["label"]}">')
+                for prop in edge["properties"]:
+                    lines.append(f'    <property name="{prop["name"]}" type="{prop["type"]}" />')
+                lines.append("  </rel>")
             else:
-                rel_lines.append(f'  <rel label="{edge["label"]}" />')
-        relationships_xml = "<relationships>\n" + "\n".join(rel_lines) + "\n</relationships>"
+                lines.append(f'  <rel label="{edge["label"]}" />')
+        if not edges:
+            lines.append("")
+        lines.append("</relationships>")
 
-        # Combine all sections
-        return f"{structure_xml}\n{nodes_xml}\n{relationships_xml}"
+        return "\n".join(lines)